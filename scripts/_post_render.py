@@ -0,0 +1,69 @@
+import os
+from datetime import datetime
+
+POSTS_DIR = os.path.join("content", "posts")
+
+# Markdown templates for the generated post, filled with str.format_map.
+POST_HEADER_TEMPLATE = """---
+title: "{post_title}"
+date: {iso}
+draft: false
+tags: ["Ranking", "Gadget", "Recommendation"]
+categories: ["Automated Ranking"]
+---
+
+AIエージェントのクローと編集部が厳選した、おすすめガジェットランキングTOP{count}を自動生成しました。日々の価格変動をチェックして、賢い買い物をサポートします！
+
+"""
+
+PRODUCT_TEMPLATE = """
+## 第{rank}位：{title}
+
+![{title}]({image_url})
+
+**価格:** {price}
+
+[Amazonで詳しく見る]({url})
+***
+"""
+
+def render_markdown(products, *, now=None):
+    """
+    Render the ranking post for the given products as a Markdown string.
+    """
+    if now is None:
+        now = datetime.now()
+    today = now.strftime("%Y-%m-%d")
+    post_title = f"【{today}更新】編集部おすすめガジェットランキングTOP{len(products)}"
+
+    parts = [POST_HEADER_TEMPLATE.format_map({
+        "post_title": post_title,
+        "iso": now.isoformat(),
+        "count": len(products),
+    })]
+
+    for i, product in enumerate(products):
+        parts.append(PRODUCT_TEMPLATE.format_map({**product, "rank": i + 1}))
+    return "".join(parts)
+
+def write_post(filename, content):
+    """
+    Write a post into the posts directory and return its path.
+    The post is written to a temp file and fsynced, then swapped into place so
+    readers never see a half-written post, even after a crash.
+    """
+    output_path = os.path.join(POSTS_DIR, filename)
+    tmp_path = output_path + ".tmp"
+    try:
+        # A buffered file keeps writing until every byte is out or raises,
+        # unlike a raw FileIO.write, which may stop short and return the count.
+        with open(tmp_path, "wb") as f:
+            f.write(content.encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, output_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return output_path
@@ -1,74 +1,304 @@
+import asyncio
+import html
+import math
 import os
+import random
 import re
+import sqlite3
 import time
 from datetime import datetime
-import requests
+import aiohttp
 from bs4 import BeautifulSoup
+from _post_render import POSTS_DIR, render_markdown, write_post
 
-def get_product_details(url, associate_tag):
+# Retries rotate through these so a CAPTCHA'd client doesn't retry with the same fingerprint.
+USER_AGENTS = (
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+    'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1.1 Safari/605.1.15',
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:89.0) Gecko/20100101 Firefox/89.0',
+)
+
+HEADERS = {
+    'User-Agent': USER_AGENTS[0],
+    'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7',
+    # aiohttp decompresses these transparently; Brotli support comes from the Brotli package.
+    'Accept-Encoding': 'gzip, deflate, br',
+}
+
+MAX_CONCURRENT_REQUESTS = 5
+CONNECTION_POOL_SIZE = 8
+STREAM_CHUNK_SIZE = 64 * 1024
+# Once title and price are found, stop reading here even if the (optional) image hasn't shown up.
+STREAM_IMAGE_SEARCH_LIMIT = 512 * 1024
+
+# Retries use jittered exponential back-off and only fire on transient statuses.
+RETRY_ATTEMPTS = 3
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+# A Retry-After longer than this means the ASIN is given up rather than stalling the daily job.
+RETRY_MAX_DELAY_SECONDS = 30
+
+# Parsed product details are cached on disk by ASIN to skip re-fetching recently seen pages.
+# This serves local and repeated runs; the once-a-day CI job does not keep the file between runs.
+CACHE_PATH = "amazon_cache.sqlite"
+CACHE_TTL_SECONDS = 6 * 60 * 60
+
+ASIN_RE = re.compile(r'/dp/([A-Z0-9]{10})')
+CAPTCHA_MARKER = b'Amazon CAPTCHA'
+
+# Fast-path patterns for the three fields we need, matched against the raw page bytes.
+# Each requires its closing delimiter so a match on a partially streamed page is never truncated,
+# and non-blank text so an empty element is a miss rather than an empty field.
+TITLE_RE = re.compile(rb'id="productTitle"[^>]*>\s*([^<\s][^<]*)<')
+# Mirrors the '.a-price .a-offscreen' selector: only the a-offscreen span directly inside an
+# a-price wrapper counts, not the other a-offscreen spans (e.g. "Skip to main") on the page.
+PRICE_RE = re.compile(rb'class="a-price(?:\s[^"]*)?"[^>]*>\s*<span class="a-offscreen">\s*([^<\s][^<]*)<')
+# The landing image is matched as a whole <img> tag (quoted attribute values may contain
+# '>'), and src is then read from that tag, so attribute order doesn't matter.
+IMG_TAG_RE = re.compile(rb'<img\b(?:[^>"\']|"[^"]*"|\'[^\']*\')*?\sid="landingImage"(?:[^>"\']|"[^"]*"|\'[^\']*\')*>')
+IMG_SRC_RE = re.compile(rb'\ssrc="([^"]+)"')
+REQUIRED_FIELD_PATTERNS = (TITLE_RE, PRICE_RE)
+
+class CaptchaDetected(Exception):
+    """Raised when Amazon serves its CAPTCHA page instead of the product page."""
+
+def parse_retry_after(value):
     """
-    Given an Amazon URL, fetch the page, handle retries, and extract product details.
+    Return the delay in seconds from a Retry-After header, or None if absent,
+    not numeric, or not finite (float() also accepts "inf" and "nan").
     """
-    # 1. URL Normalization: Extract ASIN and create a clean, canonical URL.
-    asin_match = re.search(r'/dp/([A-Z0-9]{10})', url)
-    if not asin_match:
-        print(f"Warning: Could not find a valid ASIN in URL: {url}. Skipping.")
+    try:
+        delay = float(value)
+    except (TypeError, ValueError):
         return None
-    asin = asin_match.group(1)
-    normalized_url = f"https://www.amazon.co.jp/dp/{asin}"
+    if not math.isfinite(delay):
+        return None
+    return max(0.0, delay)
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Seconds to wait before the next attempt: the server's Retry-After if given
+    (get_product_details gives up on values above RETRY_MAX_DELAY_SECONDS),
+    otherwise exponential back-off with random jitter so parallel runs spread out.
+    """
+    if retry_after is not None:
+        return retry_after
+    base = RETRY_BACKOFF_FACTOR * (2 ** attempt)
+    return base + random.uniform(0, base)
+
+def _decode_match(match):
+    return html.unescape(match.group(1).decode("utf-8", errors="replace")).strip()
+
+async def read_product_page(response):
+    """
+    Read a product page in chunks, stopping early once title and price have been seen
+    along with the landing image (or STREAM_IMAGE_SEARCH_LIMIT bytes without it),
+    so the tail of the page is not read or scanned.
+    Raises CaptchaDetected as soon as the CAPTCHA marker shows up in the raw bytes.
+    """
+    page = bytearray()
+    pending = list(REQUIRED_FIELD_PATTERNS)
+    image_seen = False
+    # The marker may straddle a chunk boundary, so each scan re-checks that many bytes.
+    captcha_overlap = len(CAPTCHA_MARKER) - 1
+    async for chunk in response.content.iter_chunked(STREAM_CHUNK_SIZE):
+        scan_from = max(0, len(page) - captcha_overlap)
+        page += chunk
+        if page.find(CAPTCHA_MARKER, scan_from) != -1:
+            raise CaptchaDetected(str(response.url))
+        # Matched fields are dropped so each chunk only re-scans for what is still missing.
+        pending = [pattern for pattern in pending if not pattern.search(page)]
+        image_seen = image_seen or IMG_TAG_RE.search(page) is not None
+        if not pending and (image_seen or len(page) >= STREAM_IMAGE_SEARCH_LIMIT):
+            break
+    return bytes(page)
 
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
-        'Accept-Language': 'ja-JP,ja;q=0.9,en-US;q=0.8,en;q=0.7',
+def extract_product_fields(page):
+    """
+    Extract (title, price, image_url) from a product page given as bytes.
+    Uses the precompiled regexes first and only builds a DOM when one of them misses.
+    """
+    title_match = TITLE_RE.search(page)
+    price_match = PRICE_RE.search(page)
+    image_tag = IMG_TAG_RE.search(page)
+    src_match = IMG_SRC_RE.search(image_tag.group(0)) if image_tag else None
+    if title_match and price_match and src_match:
+        title, price, image_url = (_decode_match(m) for m in (title_match, price_match, src_match))
+        # Entities such as &nbsp; can still decode to blank text; treat that as a miss.
+        if title and price and image_url:
+            return title, price, image_url
+
+    soup = BeautifulSoup(page, 'lxml')
+
+    title_element = soup.select_one('#productTitle')
+    title = title_element.get_text(strip=True) if title_element else None
+
+    price_element = soup.select_one('.a-price .a-offscreen')
+    price = price_element.get_text(strip=True) if price_element else None
+
+    image_element = soup.select_one('#landingImage')
+    image_url = image_element['src'] if image_element else None
+
+    return title, price, image_url
+
+def open_product_cache(path=CACHE_PATH):
+    """
+    Open (and create if needed) the sqlite cache of parsed product details.
+    Returns None if the cache file is unusable (corrupt, locked, ...), in which
+    case products are simply fetched without caching.
+    """
+    conn = None
+    try:
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS products ("
+            "asin TEXT PRIMARY KEY, title TEXT, price TEXT, image_url TEXT, fetched_at REAL)"
+        )
+        return conn
+    except sqlite3.Error as e:
+        print(f"Warning: Could not open product cache {path}: {e}. Continuing without it.")
+        if conn is not None:
+            conn.close()
+        return None
+
+def load_cached_product(cache, asin):
+    """
+    Return (title, price, image_url) for an ASIN if it was cached within the TTL, else None.
+    """
+    if cache is None:
+        return None
+    try:
+        return cache.execute(
+            "SELECT title, price, image_url FROM products WHERE asin = ? AND fetched_at > ?",
+            (asin, time.time() - CACHE_TTL_SECONDS),
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Warning: Could not read product cache for {asin}: {e}")
+        return None
+
+def store_cached_product(cache, asin, title, price, image_url):
+    if cache is None:
+        return
+    try:
+        with cache:
+            cache.execute(
+                "INSERT OR REPLACE INTO products VALUES (?, ?, ?, ?, ?)",
+                (asin, title, price, image_url, time.time()),
+            )
+    except sqlite3.Error as e:
+        print(f"Warning: Could not write product cache for {asin}: {e}")
+
+def build_product(asin, associate_tag, title, price, image_url):
+    affiliate_url = f"https://www.amazon.co.jp/dp/{asin}/?tag={associate_tag}"
+    return {
+        "title": title,
+        "price": price,
+        "url": affiliate_url,
+        "image_url": image_url,
     }
 
-    # 2. Retry Logic: Attempt to fetch the page up to 3 times.
-    for attempt in range(3):
-        try:
-            print(f"Fetching (Attempt {attempt + 1}/3): {normalized_url}")
-            response = requests.get(normalized_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            # Check if we got a CAPTCHA page by looking for its title.
-            if "Amazon CAPTCHA" in response.text:
-                print(f"Warning: CAPTCHA detected for {normalized_url}. Retrying after a delay...")
-                time.sleep(2 * (attempt + 1)) # Increase delay with each retry
-                continue
+def extract_unique_asins(urls):
+    """
+    Extract ASINs from a list of Amazon URLs, dropping invalid URLs and duplicates
+    that point to the same product, while keeping the original order.
+    """
+    asins = []
+    seen = set()
+    for url in urls:
+        asin_match = ASIN_RE.search(url)
+        if not asin_match:
+            print(f"Warning: Could not find a valid ASIN in URL: {url}. Skipping.")
+            continue
+        asin = asin_match.group(1)
+        if asin in seen:
+            continue
+        seen.add(asin)
+        asins.append(asin)
+    return asins
 
-            soup = BeautifulSoup(response.content, 'html.parser')
+async def get_product_details(session, semaphore, cache, asin, associate_tag):
+    """
+    Given an ASIN, fetch the product page, handle retries, and extract product details.
+    Recently fetched ASINs are served from the on-disk cache without a request.
+    """
+    # 1. Use the clean, canonical URL for the product.
+    normalized_url = f"https://www.amazon.co.jp/dp/{asin}"
 
-            # 3. Robust Data Extraction
-            title_element = soup.select_one('#productTitle')
-            title = title_element.get_text(strip=True) if title_element else None
+    cached = load_cached_product(cache, asin)
+    if cached:
+        print(f"Cache hit: Found '{cached[0]}'")
+        return build_product(asin, associate_tag, *cached)
 
-            price_element = soup.select_one('.a-price .a-offscreen')
-            price = price_element.get_text(strip=True) if price_element else None
+    # 2. Retry Logic: Attempt to fetch the page up to RETRY_ATTEMPTS times.
+    for attempt in range(RETRY_ATTEMPTS):
+        retry_after = None
+        try:
+            print(f"Fetching (Attempt {attempt + 1}/{RETRY_ATTEMPTS}): {normalized_url}")
+            headers = {'User-Agent': USER_AGENTS[attempt % len(USER_AGENTS)]}
+            # The semaphore caps how many pages are in flight at once.
+            async with semaphore:
+                async with session.get(normalized_url, headers=headers) as response:
+                    if response.status in RETRY_STATUS_CODES:
+                        retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    response.raise_for_status()
+                    # Raises CaptchaDetected if we got a CAPTCHA page instead.
+                    page = await read_product_page(response)
 
-            image_element = soup.select_one('#landingImage')
-            image_url = image_element['src'] if image_element else None
+            # 3. Robust Data Extraction
+            # Run in a worker thread so a fallback DOM parse doesn't stall the other fetches.
+            title, price, image_url = await asyncio.to_thread(extract_product_fields, page)
             
             # If we can't find the title or price, it's not a valid product page.
             if not title or not price:
                 print(f"Warning: Could not extract title or price for {normalized_url}. Skipping.")
                 return None
-            
-            affiliate_url = f"https://www.amazon.co.jp/dp/{asin}/?tag={associate_tag}"
+
+            store_cached_product(cache, asin, title, price, image_url)
 
             print(f"Success: Found '{title}'")
-            return {
-                "title": title,
-                "price": price,
-                "url": affiliate_url,
-                "image_url": image_url,
-            }
-
-        except requests.exceptions.RequestException as e:
+            return build_product(asin, associate_tag, title, price, image_url)
+
+        except CaptchaDetected:
+            print(f"Warning: CAPTCHA detected for {normalized_url}. Retrying with a different User-Agent...")
+        except aiohttp.ClientResponseError as e:
+            if e.status not in RETRY_STATUS_CODES:
+                print(f"Error fetching URL {normalized_url}: {e}. Not retrying.")
+                return None
             print(f"Error fetching URL {normalized_url} on attempt {attempt + 1}: {e}")
-            time.sleep(2 * (attempt + 1))
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Error fetching URL {normalized_url} on attempt {attempt + 1}: {e}")
+
+        if retry_after is not None and retry_after > RETRY_MAX_DELAY_SECONDS:
+            print(f"Warning: {normalized_url} asked to retry after {retry_after:.0f}s. Giving up on this product.")
+            return None
+
+        if attempt + 1 < RETRY_ATTEMPTS:
+            await asyncio.sleep(backoff_delay(attempt, retry_after))
             
-    print(f"Failed to fetch {normalized_url} after 3 attempts.")
+    print(f"Failed to fetch {normalized_url} after {RETRY_ATTEMPTS} attempts.")
     return None
 
+async def fetch_all_product_details(asins, associate_tag):
+    """
+    Fetch details for all given ASINs concurrently over a single HTTP session.
+    """
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+    timeout = aiohttp.ClientTimeout(total=10)
+    # A pooled connector keeps connections to amazon.co.jp alive, so retries
+    # and later URLs reuse an existing TLS connection instead of a new handshake.
+    # aiohttp already sets TCP_NODELAY on its sockets.
+    connector = aiohttp.TCPConnector(limit=CONNECTION_POOL_SIZE, limit_per_host=CONNECTION_POOL_SIZE)
+    cache = open_product_cache()
+    try:
+        async with aiohttp.ClientSession(headers=HEADERS, timeout=timeout, connector=connector) as session:
+            return await asyncio.gather(
+                *[get_product_details(session, semaphore, cache, asin, associate_tag) for asin in asins],
+                return_exceptions=True,
+            )
+    finally:
+        if cache is not None:
+            cache.close()
+
 def generate_post_from_urls():
     """
     Reads a list of URLs from urls.txt and generates a Markdown post.
@@ -78,6 +308,16 @@ def generate_post_from_urls():
         print("Error: ASSOCIATE_TAG not found in environment variables.")
         return
 
+    # Make sure the output directory exists before paying for any fetches.
+    os.makedirs(POSTS_DIR, exist_ok=True)
+
+    # Take a single timestamp so the filename date and front-matter date always agree.
+    now = datetime.now()
+    filename = f"{now.strftime('%Y-%m-%d')}-recommended-gadgets-ranking.md"
+    if os.path.exists(os.path.join(POSTS_DIR, filename)):
+        print(f"Info: A post for today already exists ({filename}). Skipping post generation.")
+        return
+
     try:
         with open("urls.txt", "r", encoding="utf-8") as f:
             urls = [line.strip() for line in f if line.strip()]
@@ -89,53 +329,26 @@ def generate_post_from_urls():
         print("Info: urls.txt is empty. Skipping post generation.")
         return
 
-    print(f"Found {len(urls)} URLs. Fetching details...")
+    asins = extract_unique_asins(urls)[:5] # Process up to 5 distinct products
+    print(f"Found {len(urls)} URLs ({len(asins)} distinct products selected). Fetching details...")
     products = []
-    for url in urls[:5]: # Process up to 5 URLs
-        details = get_product_details(url, associate_tag)
-        if details:
+    results = asyncio.run(fetch_all_product_details(asins, associate_tag))
+    for asin, details in zip(asins, results):
+        if isinstance(details, Exception):
+            print(f"Error: Unexpected failure while processing ASIN {asin}: {details}")
+        elif details:
             products.append(details)
-        time.sleep(1) # Be respectful and wait 1 second between requests
     
     if not products:
         print("Error: Could not fetch valid details for any of the URLs provided.")
         return
 
     # --- Generate Markdown Content ---
-    today = datetime.now().strftime("%Y-%m-%d")
-    post_title = f"【{today}更新】編集部おすすめガジェットランキングTOP{len(products)}"
-    filename = f"{today}-recommended-gadgets-ranking.md"
-    
-    markdown_content = f"""---
-title: "{post_title}"
-date: {datetime.now().isoformat()}
-draft: false
-tags: ["Ranking", "Gadget", "Recommendation"]
-categories: ["Automated Ranking"]
----
-
-AIエージェントのクローと編集部が厳選した、おすすめガジェットランキングTOP{len(products)}を自動生成しました。日々の価格変動をチェックして、賢い買い物をサポートします！
-
-"""
-
-    for i, product in enumerate(products):
-        rank = i + 1
-        markdown_content += f"""
-## 第{rank}位：{product['title']}
-
-![{product['title']}]({product['image_url']})
-
-**価格:** {product['price']}
-
-[Amazonで詳しく見る]({product['url']})
-***
-"""
+    markdown_content = render_markdown(products, now=now)
     
     # --- Write to File ---
-    output_path = os.path.join("content", "posts", filename)
     try:
-        with open(output_path, "w", encoding="utf-8") as f:
-            f.write(markdown_content)
+        output_path = write_post(filename, markdown_content)
         print(f"Successfully generated post from URL list: {output_path}")
     except Exception as e:
         print(f"Error writing to file: {e}")
@@ -0,0 +1,66 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import generate_post
+
+# Trimmed from a real amazon.co.jp product page: alt/src come before id, and the
+# onload handler contains a '>' inside its quoted value.
+PRODUCT_PAGE = (
+    b'<html><body>'
+    b'<span id="productTitle" class="a-size-large product-title-word-break">'
+    b'        Pixio PX248 Wave White \xe3\x82\xb2\xe3\x83\xbc\xe3\x83\x9f\xe3\x83\xb3\xe3\x82\xb0\xe3\x83\xa2\xe3\x83\x8b\xe3\x82\xbf\xe3\x83\xbc 23.8&quot;       </span>'
+    b'<span class="a-price aok-align-center" data-a-size="xl"><span class="a-offscreen">\xef\xbf\xa519,980</span>'
+    b'<span aria-hidden="true">19,980</span></span>'
+    b'<img alt="Pixio PX248 Wave White" src="https://m.media-amazon.com/images/I/71f4BinbCqL._AC_SY300_SX300_QL70_ML2_.jpg"'
+    b' data-old-hires="" onload="markFeatureRenderForImageBlock(); if(this.width/this.height > 1.0){this.className += \' a-stretch-horizontal\'}"'
+    b' data-a-image-name="landingImage" data-a-dynamic-image="{&quot;https://m.media-amazon.com/images/I/71f4BinbCqL.jpg&quot;:[679,679]}"'
+    b' style="max-width:679px;max-height:679px;" id="landingImage">'
+    b'</body></html>'
+)
+
+
+class ExtractProductFieldsTest(unittest.TestCase):
+    def test_fast_path_handles_src_before_id(self):
+        # The fast path must not fall back to building a DOM for a realistic tag.
+        with mock.patch.object(generate_post, "BeautifulSoup", side_effect=AssertionError("fell back to DOM parse")):
+            title, price, image_url = generate_post.extract_product_fields(PRODUCT_PAGE)
+
+        self.assertEqual(title, 'Pixio PX248 Wave White ゲーミングモニター 23.8"')
+        self.assertEqual(price, "￥19,980")
+        self.assertEqual(image_url, "https://m.media-amazon.com/images/I/71f4BinbCqL._AC_SY300_SX300_QL70_ML2_.jpg")
+
+    def test_image_tag_with_quoted_gt_inside_attribute(self):
+        page = b'<img onload="if(a > b){}" src="https://example.com/a.jpg" id="landingImage">'
+        tag = generate_post.IMG_TAG_RE.search(page)
+        self.assertIsNotNone(tag)
+        self.assertEqual(generate_post.IMG_SRC_RE.search(tag.group(0)).group(1), b"https://example.com/a.jpg")
+
+    def test_image_name_attribute_is_not_mistaken_for_id(self):
+        page = b'<img src="https://example.com/b.jpg" data-a-image-name="landingImage">'
+        self.assertIsNone(generate_post.IMG_TAG_RE.search(page))
+
+    def test_price_ignores_a_offscreen_outside_a_price(self):
+        page = b'<span class="a-offscreen">Skip to main</span>' + PRODUCT_PAGE
+        with mock.patch.object(generate_post, "BeautifulSoup", side_effect=AssertionError("fell back to DOM parse")):
+            _, price, _ = generate_post.extract_product_fields(page)
+        self.assertEqual(price, "￥19,980")
+
+    def test_price_skips_blank_a_offscreen_span(self):
+        page = b'<span class="a-offscreen">   </span>' + PRODUCT_PAGE
+        with mock.patch.object(generate_post, "BeautifulSoup", side_effect=AssertionError("fell back to DOM parse")):
+            _, price, _ = generate_post.extract_product_fields(page)
+        self.assertEqual(price, "￥19,980")
+
+    def test_blank_fast_path_price_falls_back_to_dom(self):
+        page = PRODUCT_PAGE.replace(b'<span class="a-offscreen">\xef\xbf\xa519,980</span>', b'<span class="a-offscreen">&nbsp;</span>')
+        with mock.patch.object(generate_post, "BeautifulSoup", wraps=generate_post.BeautifulSoup) as soup:
+            generate_post.extract_product_fields(page)
+        soup.assert_called_once()
+
+
+if __name__ == "__main__":
+    unittest.main()
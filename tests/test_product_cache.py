@@ -0,0 +1,48 @@
+import io
+import os
+import sys
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import generate_post
+
+
+class ProductCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.cache = generate_post.open_product_cache(":memory:")
+        self.addCleanup(self.cache.close)
+
+    def test_corrupt_cache_file_is_skipped_with_warning(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "amazon_cache.sqlite")
+            with open(path, "wb") as f:
+                f.write(b"this is not a sqlite database" * 10)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                cache = generate_post.open_product_cache(path)
+        self.assertIsNone(cache)
+        self.assertIn("Warning: Could not open product cache", output.getvalue())
+        # The rest of the cache API treats a missing cache as always-miss.
+        self.assertIsNone(generate_post.load_cached_product(cache, "B000000000"))
+        generate_post.store_cached_product(cache, "B000000000", "Monitor", "￥1,000", None)
+
+    def test_row_is_served_within_ttl(self):
+        with mock.patch.object(generate_post.time, "time", return_value=1_000_000.0):
+            generate_post.store_cached_product(self.cache, "B000000000", "Monitor", "￥1,000", "https://example.com/a.jpg")
+        with mock.patch.object(generate_post.time, "time", return_value=1_000_000.0 + generate_post.CACHE_TTL_SECONDS - 1):
+            row = generate_post.load_cached_product(self.cache, "B000000000")
+        self.assertEqual(row, ("Monitor", "￥1,000", "https://example.com/a.jpg"))
+
+    def test_expired_row_is_not_served(self):
+        with mock.patch.object(generate_post.time, "time", return_value=1_000_000.0):
+            generate_post.store_cached_product(self.cache, "B000000000", "Monitor", "￥1,000", None)
+        with mock.patch.object(generate_post.time, "time", return_value=1_000_000.0 + generate_post.CACHE_TTL_SECONDS + 1):
+            self.assertIsNone(generate_post.load_cached_product(self.cache, "B000000000"))
+
+
+if __name__ == "__main__":
+    unittest.main()
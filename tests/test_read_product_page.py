@@ -0,0 +1,76 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import generate_post
+
+TITLE = b'<span id="productTitle">Monitor</span>'
+PRICE = b'<span class="a-price"><span class="a-offscreen">\xef\xbf\xa51,000</span></span>'
+IMAGE = b'<img src="https://example.com/a.jpg" id="landingImage">'
+FILLER = b'<div>' + b'x' * 100 + b'</div>'
+
+
+class FakeContent:
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.served = 0
+
+    async def iter_chunked(self, size):
+        for chunk in self.chunks:
+            self.served += 1
+            yield chunk
+
+
+class FakeResponse:
+    url = "https://www.amazon.co.jp/dp/B000000000"
+
+    def __init__(self, chunks):
+        self.content = FakeContent(chunks)
+
+
+class ReadProductPageTest(unittest.IsolatedAsyncioTestCase):
+    async def test_stops_once_title_price_and_image_are_seen(self):
+        response = FakeResponse([TITLE, PRICE, IMAGE, FILLER, FILLER])
+        page = await generate_post.read_product_page(response)
+        self.assertEqual(response.content.served, 3)
+        self.assertEqual(page, TITLE + PRICE + IMAGE)
+
+    async def test_stops_at_image_search_limit_without_image(self):
+        response = FakeResponse([TITLE, PRICE] + [FILLER] * 10)
+        limit = len(TITLE + PRICE) + 2 * len(FILLER)
+        with mock.patch.object(generate_post, "STREAM_IMAGE_SEARCH_LIMIT", limit):
+            page = await generate_post.read_product_page(response)
+        self.assertEqual(response.content.served, 4)
+        self.assertEqual(len(page), limit)
+
+    async def test_reads_to_the_end_when_price_is_missing(self):
+        chunks = [TITLE, IMAGE] + [FILLER] * 5
+        response = FakeResponse(chunks)
+        page = await generate_post.read_product_page(response)
+        self.assertEqual(response.content.served, len(chunks))
+        self.assertEqual(page, b"".join(chunks))
+
+    async def test_stray_a_offscreen_does_not_stop_before_real_price(self):
+        stray = b'<span class="a-offscreen">Skip to main</span>'
+        chunks = [stray, TITLE, IMAGE, FILLER, PRICE, FILLER]
+        response = FakeResponse(chunks)
+        page = await generate_post.read_product_page(response)
+        self.assertEqual(response.content.served, 5)
+        self.assertEqual(generate_post.extract_product_fields(page)[1], "￥1,000")
+
+    async def test_captcha_marker_split_across_chunks_is_detected(self):
+        response = FakeResponse([FILLER + b'<title>Amazon CAP', b'TCHA</title>' + FILLER])
+        with self.assertRaises(generate_post.CaptchaDetected):
+            await generate_post.read_product_page(response)
+
+    async def test_page_without_captcha_marker_is_not_flagged(self):
+        chunks = [FILLER + b'<title>Amazon CAP', b'ITAL</title>', TITLE, PRICE, IMAGE]
+        page = await generate_post.read_product_page(FakeResponse(chunks))
+        self.assertEqual(page, b"".join(chunks))
+
+
+if __name__ == "__main__":
+    unittest.main()
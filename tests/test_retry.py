@@ -0,0 +1,118 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+import aiohttp
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "scripts"))
+
+import generate_post
+
+PRODUCT_PAGE = (
+    b'<span id="productTitle">Monitor</span>'
+    b'<span class="a-price"><span class="a-offscreen">\xef\xbf\xa51,000</span></span>'
+    b'<img src="https://example.com/a.jpg" id="landingImage">'
+)
+
+
+class FakeContent:
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        yield self.body
+
+
+class FakeResponse:
+    def __init__(self, url, status, headers=None, body=b""):
+        self.url = url
+        self.status = status
+        self.headers = headers or {}
+        self.content = FakeContent(body)
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise aiohttp.ClientResponseError(
+                mock.Mock(real_url=self.url), (), status=self.status, message="error"
+            )
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+
+class FakeSession:
+    """Serves the queued responses in order and records each request."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.requests = 0
+
+    def get(self, url, headers=None):
+        self.requests += 1
+        status, response_headers, body = self.responses.pop(0)
+        return FakeResponse(url, status, response_headers, body)
+
+
+class ParseRetryAfterTest(unittest.TestCase):
+    def test_rejects_non_finite_and_non_numeric_values(self):
+        for value in ("inf", "nan", "infinity", "Wed, 21 Oct 2026 07:28:00 GMT", None):
+            with self.subTest(value=value):
+                self.assertIsNone(generate_post.parse_retry_after(value))
+
+    def test_clamps_negative_values_to_zero(self):
+        self.assertEqual(generate_post.parse_retry_after("-5"), 0.0)
+
+    def test_parses_seconds(self):
+        self.assertEqual(generate_post.parse_retry_after("7"), 7.0)
+
+
+class BackoffDelayTest(unittest.TestCase):
+    def test_exponential_with_jitter(self):
+        for attempt in range(3):
+            base = generate_post.RETRY_BACKOFF_FACTOR * 2 ** attempt
+            with mock.patch.object(generate_post.random, "uniform", side_effect=lambda low, high: high):
+                self.assertEqual(generate_post.backoff_delay(attempt), 2 * base)
+            with mock.patch.object(generate_post.random, "uniform", side_effect=lambda low, high: low):
+                self.assertEqual(generate_post.backoff_delay(attempt), base)
+
+    def test_uses_retry_after_when_given(self):
+        self.assertEqual(generate_post.backoff_delay(0, retry_after=4.0), 4.0)
+
+
+class GetProductDetailsRetryTest(unittest.IsolatedAsyncioTestCase):
+    async def fetch(self, session):
+        with mock.patch.object(generate_post.asyncio, "sleep", new=mock.AsyncMock()) as sleep:
+            product = await generate_post.get_product_details(
+                session, generate_post.asyncio.Semaphore(1), None, "B000000000", "tag-22"
+            )
+        return product, sleep
+
+    async def test_long_retry_after_gives_up_after_one_attempt(self):
+        session = FakeSession((503, {"Retry-After": "120"}, b""), (200, {}, PRODUCT_PAGE))
+        product, sleep = await self.fetch(session)
+        self.assertIsNone(product)
+        self.assertEqual(session.requests, 1)
+        sleep.assert_not_awaited()
+
+    async def test_not_found_is_not_retried(self):
+        session = FakeSession((404, {}, b""), (200, {}, PRODUCT_PAGE))
+        product, sleep = await self.fetch(session)
+        self.assertIsNone(product)
+        self.assertEqual(session.requests, 1)
+        sleep.assert_not_awaited()
+
+    async def test_transient_error_then_success(self):
+        session = FakeSession((503, {}, b""), (200, {}, PRODUCT_PAGE))
+        product, sleep = await self.fetch(session)
+        self.assertEqual(session.requests, 2)
+        sleep.assert_awaited_once()
+        self.assertEqual(product["title"], "Monitor")
+        self.assertEqual(product["url"], "https://www.amazon.co.jp/dp/B000000000/?tag=tag-22")
+
+
+if __name__ == "__main__":
+    unittest.main()